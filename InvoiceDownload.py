@@ -1,9 +1,13 @@
-import glob
 import time
+import atexit
 import datetime
 import logging
+import logging.handlers
 import os
+import queue
+import threading
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
 from typing import List, Tuple
 
@@ -16,42 +20,207 @@ from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support.ui import Select
-from selenium.common.exceptions import TimeoutException, WebDriverException
+from selenium.common.exceptions import StaleElementReferenceException, TimeoutException, WebDriverException
+
+try:
+    from watchdog.events import PatternMatchingEventHandler
+    from watchdog.observers import Observer
+except ImportError:  # watchdog is optional, fall back to polling the download directory
+    PatternMatchingEventHandler = object
+    Observer = None
+
+# Locators are built once at import time and shared by every call
+_BUSINESS_LOGIN_LINK = (By.CSS_SELECTOR, 'a[href^="/accounts/login/b"]')
+_LOGIN_FIELDS = (
+    ((By.ID, "ban"), "ban"),
+    ((By.ID, "user_id"), "user_id"),
+    ((By.ID, "user_password"), "password")
+)
+_CAPTCHA_INPUT = (By.ID, "captcha")
+_SUBMIT_BUTTON = (By.ID, "submitBtn")
+_POPUP_SELECTORS = (
+    'button[aria-label="Close"]',
+    '.modal-close',
+    '.close',
+    'button.btn-close',
+    '[data-dismiss="modal"]'
+)
+_POPUP_TEXTS = ('關閉', '確定', 'OK', 'Close')
+_OPEN_MODAL = (By.CSS_SELECTOR, '.modal.show')
+_NAV_STEPS = (
+    (By.ID, 'headingFunctionB2B_MENU'),
+    (By.ID, 'headingFunctionB2BC_SINGLE_QRY_DOWN'),
+    (By.ID, 'headingFunctionBTB412W')
+)
+_DATE_INPUT = (By.ID, "dp-input-date01")
+_DATE_OVERLAY = (By.CSS_SELECTOR, ".dp__overlay.dp--overlay-relative")
+_YEAR_SELECT = (By.CSS_SELECTOR, ".dp__btn.dp--year-select")
+_PREV_YEAR = (By.CSS_SELECTOR, ".dp__btn.dp--arrow-btn-nav[aria-label='Previous year']")
+_NEXT_YEAR = (By.CSS_SELECTOR, ".dp__btn.dp--arrow-btn-nav[aria-label='Next year']")
+_MONTH_CELLS = tuple((By.CSS_SELECTOR, f'div[data-test="{month}月"]') for month in range(1, 13))
+_RADIO_OPTIONS = ("queryInvType_1", "businessType_1")
+_SEARCH_BUTTON = (By.CSS_SELECTOR, 'button[title="查詢"]')
+_SEARCH_SUCCESS_TEXT = '查詢成功。'
+_PAGE_SIZE_SELECT = (By.CSS_SELECTOR, 'select[title="分頁"]')
+_CHECKBOX_ALL = (By.ID, "checkbox-all")
+_DOWNLOAD_BUTTON = (By.CSS_SELECTOR, 'button[title="下載Excel檔"]')
+_NEXT_PAGE_BUTTON = (By.CSS_SELECTOR, 'button[title="下一頁"]')
+_RESULT_ROWS = (By.CSS_SELECTOR, 'table tbody tr')
+
+
+class _DownloadEventHandler(PatternMatchingEventHandler):
+    """Signal once every expected download has landed in the download directory."""
+    
+    def __init__(self, downloader, finished: threading.Event):
+        # Let watchdog drop unrelated files before our callbacks run
+        super().__init__(patterns=[f"*{downloader.prefix}*.xls"], ignore_directories=True)
+        self.downloader = downloader
+        self.finished = finished
+    
+    def on_created(self, event):
+        self._check(event.src_path)
+    
+    def on_moved(self, event):
+        self._check(event.dest_path)
+    
+    def _check(self, path: str):
+        name = os.path.basename(path)
+        if not (name.startswith(self.downloader.prefix) and name.endswith(".xls")):
+            return
+        if os.path.exists(f"{path}.crdownload"):
+            return
+        expected = self.downloader.total_downloads
+        if len(self.downloader._list_output_files(expected)) == expected:
+            self.finished.set()
 
 
 class InvoiceDownloader:
     """Automated invoice downloader for Taiwan e-invoice system."""
     
+    # Scroll an element into view and click it in one round trip
+    _SCROLL_AND_CLICK_JS = "arguments[0].scrollIntoView({block: 'center'}); arguments[0].click();"
+    
+    # Find an element by selector and click it arguments[1] times, false if it is not rendered yet
+    _CLICK_REPEATEDLY_JS = """
+        const el = document.querySelector(arguments[0]);
+        if (!el) { return false; }
+        for (let i = 0; i < arguments[1]; i++) { el.click(); }
+        return true;
+    """
+    
+    # Click the first visible popup close button, by selector then by button text
+    _DISMISS_POPUP_JS = """
+        const visible = el => !!(el.offsetWidth || el.offsetHeight || el.getClientRects().length);
+        for (const selector of arguments[0]) {
+            const el = Array.from(document.querySelectorAll(selector)).find(visible);
+            if (el) { el.click(); return ['selector', selector]; }
+        }
+        const buttons = Array.from(document.querySelectorAll('button')).filter(visible);
+        for (const text of arguments[1]) {
+            const el = buttons.find(b => Array.from(b.childNodes).some(
+                n => n.nodeType === Node.TEXT_NODE && n.textContent.includes(text)));
+            if (el) { el.click(); return ['text', text]; }
+        }
+        return null;
+    """
+    
+    # Set a select's value and fire input/change; returns the previous value, or null if the option is missing
+    _SET_SELECT_VALUE_JS = """
+        const select = arguments[0];
+        const previous = select.value;
+        select.value = arguments[1];
+        if (select.value !== arguments[1]) { select.value = previous; return null; }
+        // v-model may listen on either event depending on the component
+        select.dispatchEvent(new Event('input', {bubbles: true}));
+        select.dispatchEvent(new Event('change', {bubbles: true}));
+        return previous;
+    """
+    
+    # Select all rows, press download and report the next-page state; null until the page is ready
+    _SELECT_ALL_AND_DOWNLOAD_JS = """
+        const [checkboxId, downloadSelector, nextSelector, done] = arguments;
+        const checkbox = document.getElementById(checkboxId);
+        const download = document.querySelector(downloadSelector);
+        if (!checkbox || !download) { done(null); return; }
+        if (!checkbox.checked) { checkbox.click(); }
+        // Let the page re-render the selection before pressing download
+        setTimeout(() => {
+            if (download.disabled) { done(null); return; }
+            download.click();
+            const next = document.querySelector(nextSelector);
+            done({selected: checkbox.checked, hasNext: !!next && !next.disabled});
+        }, 0);
+    """
+    
+    # True once a span with exactly the given text is rendered
+    _SPAN_TEXT_PRESENT_JS = """
+        return Array.from(document.querySelectorAll('span')).some(
+            span => span.textContent.trim() === arguments[0]);
+    """
+    
+    # Check each radio button by id and report which ones ended up checked
+    _CHECK_RADIOS_JS = """
+        return arguments[0].map(id => {
+            const el = document.getElementById(id);
+            if (el && !el.checked) { el.click(); }
+            return !!(el && el.checked);
+        });
+    """
+    
     def __init__(self, webdriver_path: str = r"chromedriver-win64\chromedriver.exe", 
-                 download_dir: str = rf"C:\Users\{loginInfo.User}\Downloads",
-                 prefix: str = f"{loginInfo.ban}_IN_{datetime.datetime.today().strftime('%Y%m%d')}",
+                 download_dir: str = None,
+                 prefix: str = None,
                  timeout: int = 30,
-                 recaptcha_solver=None):
+                 recaptcha_solver=None,
+                 parallel_months: bool = False,
+                 command_executor: str = None):
         self.webdriver_path = webdriver_path
-        self.download_dir = Path(download_dir)
+        self.command_executor = command_executor
+        # Defaults are resolved per instance so a long-lived process picks up today's date
+        self.download_dir = Path(download_dir or rf"C:\Users\{loginInfo.User}\Downloads")
         self.timeout = timeout
         self.browser = None
         self.total_downloads = 0
-        self.prefix = prefix
-        self.pattern = str(self.download_dir / f"{self.prefix}*.xls")
+        self.prefix = prefix or f"{loginInfo.ban}_IN_{datetime.date.today():%Y%m%d}"
         self.recaptcha_solver = recaptcha_solver
+        self.parallel_months = parallel_months
+        self._element_cache = {}
+        self._waits = {}
+        self._chrome_options = None
+        self._download_page_url = None
+        self._target_months_cache = None
         
-        # Setup logging
-        logging.basicConfig(level=logging.INFO,
-                            filename='einvoice.log',
-                            format='%(asctime)s - %(levelname)s - %(message)s',
-                            encoding='utf-8')
+        # Setup logging, handing records to a background thread that writes the file
+        if not logging.getLogger().handlers:
+            log_queue = queue.Queue(-1)
+            file_handler = logging.FileHandler('einvoice.log', encoding='utf-8', delay=True)
+            file_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+            listener = logging.handlers.QueueListener(log_queue, file_handler)
+            listener.start()
+            # Stopping drains the queue, so records logged after run() still reach the file
+            atexit.register(listener.stop)
+            # No basicConfig: its default formatter would be baked into each queued record
+            root_logger = logging.getLogger()
+            root_logger.setLevel(logging.INFO)
+            root_logger.addHandler(logging.handlers.QueueHandler(log_queue))
         self.logger = logging.getLogger(__name__)
     
     @contextmanager
     def get_browser(self):
         """Context manager for browser lifecycle management."""
         try:
-            service = Service(self.webdriver_path)
             options = self._get_chrome_options()
-            self.browser = webdriver.Chrome(service=service, options=options)
-            self.browser.implicitly_wait(self.timeout)
+            if self.command_executor:
+                # Attach to a long-running chromedriver instead of spawning one per run
+                self.browser = webdriver.Remote(command_executor=self.command_executor, options=options)
+            else:
+                # Without a path Selenium Manager resolves and caches a matching driver
+                service = Service(self.webdriver_path, service_args=['--disable-build-check'])
+                self.browser = webdriver.Chrome(service=service, options=options)
+            self._waits.clear()
+            # Explicit waits only; an implicit wait would stall every negative lookup
+            self.browser.implicitly_wait(0)
+            self._enable_downloads()
             yield self.browser
         except WebDriverException as e:
             self.logger.error(f"Failed to initialize browser: {e}")
@@ -63,24 +232,44 @@ class InvoiceDownloader:
                 except Exception as e:
                     self.logger.warning(f"Error closing browser: {e}")
     
+    def _enable_downloads(self):
+        """Let headless Chrome save files straight into the download directory."""
+        if not hasattr(self.browser, "execute_cdp_cmd"):
+            # Remote sessions have no CDP shortcut; the download prefs still apply
+            return
+        try:
+            self.browser.execute_cdp_cmd("Browser.setDownloadBehavior", {
+                "behavior": "allow",
+                "downloadPath": str(self.download_dir)
+            })
+        except WebDriverException as e:
+            self.logger.warning(f"Could not set download behavior via CDP: {e}")
+    
     def _get_chrome_options(self) -> Options:
-        """Configure Chrome options for optimal performance."""
+        """Configure Chrome options for optimal performance, built once per downloader."""
+        if self._chrome_options is not None:
+            return self._chrome_options
+        
         options = Options()
         
         # Performance optimizations
         options.add_experimental_option("excludeSwitches", ["enable-logging"])
         options.add_argument("--log-level=3")
         options.add_argument("--no-sandbox")
-        options.add_argument("--disable-dev-shm-usage")
         options.add_argument("--disable-gpu")
         options.add_argument("--disable-extensions")
         options.add_argument("--disable-web-security")
         options.add_argument("--allow-running-insecure-content")
         options.add_argument("--headless=new")
-        options.add_argument("--enable-unsafe-swiftshader")
+        options.add_argument("--disable-blink-features=AutomationControlled")
+        options.add_argument("--blink-settings=imagesEnabled=false")
+        options.add_argument("--disable-features=TranslateUI,InterestCohort")
         options.add_argument("--window-size=1920,1080")
         options.add_argument("--user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36")
         
+        # Return from navigation at DOMContentLoaded; explicit waits cover the rest
+        options.page_load_strategy = "eager"
+        
         # Set download preferences
         prefs = {
             "download.default_directory": str(self.download_dir),
@@ -88,28 +277,48 @@ class InvoiceDownloader:
             "download.directory_upgrade": True,
             "safebrowsing.enabled": True,
             "profile.default_content_settings.popups": 0,
-            "profile.default_content_setting_values.automatic_downloads": 1 
+            "profile.default_content_setting_values.automatic_downloads": 1,
+            "profile.default_content_setting_values.notifications": 2,
+            "profile.managed_default_content_settings.images": 2,
+            "profile.managed_default_content_settings.plugins": 2,
+            "profile.managed_default_content_settings.cookies": 1  # keep the login session
         }
         options.add_experimental_option("prefs", prefs)
         
+        self._chrome_options = options
         return options
     
-    def _wait_and_click(self, locator: tuple, timeout: int = None, use_js: bool = False) -> bool:
+    def _get_wait(self, timeout: int = None, poll: float = 0.1) -> WebDriverWait:
+        """Return the WebDriverWait for a timeout, built once per browser session."""
+        key = (timeout or self.timeout, poll)
+        wait = self._waits.get(key)
+        if wait is None:
+            wait = self._waits[key] = WebDriverWait(self.browser, key[0], poll_frequency=poll)
+        return wait
+    
+    def _wait_until(self, predicate, timeout: int = None, poll: float = 0.1):
+        """Poll a condition until it holds and return its result."""
+        return self._get_wait(timeout, poll).until(predicate)
+    
+    def _wait_and_click(self, locator: tuple, timeout: int = None, use_js: bool = False,
+                        poll: float = 0.1) -> bool:
         """Wait for element and click it safely."""
         timeout = timeout or self.timeout
+        # A JavaScript click works on covered or off-screen elements, so presence is enough
+        condition = EC.presence_of_element_located if use_js else EC.element_to_be_clickable
         try:
-            wait = WebDriverWait(self.browser, timeout)
-            element = wait.until(EC.element_to_be_clickable(locator))
-            
-            # Scroll element into view
-            self.browser.execute_script("arguments[0].scrollIntoView({block: 'center'});", element)
-            time.sleep(0.5)  # Small delay for scroll
+            element = self._wait_until(condition(locator), timeout, poll)
             
             # Try different click strategies
             if use_js:
-                # Use JavaScript click to bypass interception
-                self.browser.execute_script("arguments[0].click();", element)
+                # Use JavaScript scroll and click to bypass interception
+                self.browser.execute_script(self._SCROLL_AND_CLICK_JS, element)
             else:
+                # Scroll element into view
+                self.browser.execute_script("arguments[0].scrollIntoView({block: 'center'});", element)
+                
+                # Make sure the element is still clickable once the scroll settled
+                element = self._wait_until(EC.element_to_be_clickable(locator), timeout, poll)
                 try:
                     # First try normal click
                     element.click()
@@ -126,54 +335,109 @@ class InvoiceDownloader:
             self.logger.error(f"Failed to click element {locator}: {e}")
             return False
     
-    def _safe_send_keys(self, locator: tuple, text: str, timeout: int = None) -> bool:
+    def _cached_element(self, locator: tuple, timeout: int = None):
+        """Return the cached element for a locator, resolving it on first use."""
+        element = self._element_cache.get(locator)
+        if element is None:
+            element = self._wait_until(EC.presence_of_element_located(locator), timeout)
+            self._element_cache[locator] = element
+        return element
+    
+    def _with_cached_element(self, locator: tuple, action, timeout: int = None):
+        """Apply action to a cached element, re-resolving it once if it went stale."""
+        try:
+            return action(self._cached_element(locator, timeout))
+        except StaleElementReferenceException:
+            self._element_cache.pop(locator, None)
+            return action(self._cached_element(locator, timeout))
+    
+    def _click_cached(self, locator: tuple, timeout: int = None) -> bool:
+        """Click a cached element with JavaScript."""
+        try:
+            self._with_cached_element(
+                locator, lambda element: self.browser.execute_script(self._SCROLL_AND_CLICK_JS, element), timeout
+            )
+            return True
+        except TimeoutException:
+            self.logger.error(f"Timeout waiting for element: {locator}")
+            return False
+        except Exception as e:
+            self.logger.error(f"Failed to click element {locator}: {e}")
+            return False
+    
+    def _safe_send_keys(self, locator: tuple, text: str, timeout: int = None, poll: float = 0.1) -> bool:
         """Send keys to element safely."""
         timeout = timeout or self.timeout
         try:
-            wait = WebDriverWait(self.browser, timeout)
-            element = wait.until(EC.presence_of_element_located(locator))
+            element = self._wait_until(EC.presence_of_element_located(locator), timeout, poll)
             element.clear()
             element.send_keys(text)
             return True
         except TimeoutException:
             self.logger.error(f"Timeout waiting for input element: {locator}")
             return False
+    
+    def _result_table_snapshot(self):
+        """Capture the first result row, its text and the row count."""
+        rows = self.browser.find_elements(*_RESULT_ROWS)
+        if not rows:
+            return None
+        return rows[0], rows[0].text, len(rows)
+    
+    def _wait_for_table_change(self, snapshot, timeout: int = 10) -> bool:
+        """Wait until the result table re-renders after a paging action."""
+        if snapshot is None:
+            return True
+        first_row, first_text, row_count = snapshot
         
-    def _get_target_months(self) -> List[Tuple[datetime.datetime, str]]:
-        """Get the current month and previous month with formatted strings."""
-        now = datetime.datetime.now()
-        current_month = now
-        previous_month = None
-        
-        if now.day <= 7:
-        # Calculate previous month
-            if now.month == 1:
-                previous_month = now.replace(year=now.year - 1, month=12)
-            else:
-                previous_month = now.replace(month=now.month - 1)
+        def table_changed(driver):
+            try:
+                if first_row.text != first_text:
+                    return True
+            except StaleElementReferenceException:
+                return True
+            return len(driver.find_elements(*_RESULT_ROWS)) != row_count
         
-        months = [(current_month, f"{current_month.year}年{current_month.month}月")]
-        if previous_month:
-            months.insert(0, (previous_month, f"{previous_month.year}年{previous_month.month}月"))
+        try:
+            self._wait_until(table_changed, timeout)
+            return True
+        except TimeoutException:
+            return False
         
-        return months
+    def _get_target_months(self) -> List[Tuple[datetime.datetime, str]]:
+        """Get the current month and previous month with formatted strings."""
+        if self._target_months_cache is None:
+            now = datetime.datetime.now()
+            months = [datetime.datetime(now.year, now.month, 1)]
+            if now.day <= 7:
+                # Stepping back from the 1st lands in the previous month, January included
+                months.insert(0, (months[0] - datetime.timedelta(days=1)).replace(day=1))
+            self._target_months_cache = [(m, f"{m.year}年{m.month}月") for m in months]
+        return self._target_months_cache
     
     def cleanup_old_files(self) -> bool:
-        """Cleanup files matching the pattern."""
-        old_files = glob.glob(self.pattern)
+        """Cleanup downloaded files matching the prefix."""
+        old_files = self._list_output_files()
         
         if not old_files:
             self.logger.info("No file to clean up")
             return True
         
-        success_count = 0
-        for file in old_files:
+        # Delete in parallel and log one summary line instead of one line per file
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            futures = {executor.submit(os.remove, entry.path): entry for entry in old_files}
+        
+        deleted = []
+        for future, entry in futures.items():
             try:
-                os.remove(file)
-                self.logger.info(f"Cleanup old file: {os.path.basename(file)}")
-                success_count += 1
+                future.result()
+                deleted.append(entry.name)
             except OSError as e:
-                self.logger.warning(f"Failed to delete {os.path.basename(file)}: {e}")
+                self.logger.warning(f"Failed to delete {entry.name}: {e}")
+        
+        success_count = len(deleted)
+        if deleted:
+            self.logger.info(f"Cleanup old file(s): {', '.join(deleted[:10])}{'...' if success_count > 10 else ''}")
         
         if success_count == len(old_files):
             self.logger.info(f"Successfully cleanup {success_count} file(s)")
@@ -185,33 +449,51 @@ class InvoiceDownloader:
     def login(self) -> bool:
         """Handle the login process."""
         try:
+            # The solver loads its model in the background while the login page opens;
+            # later logins reuse it and its scratch folder, pointed at the current browser
+            if self.recaptcha_solver is None:
+                self.recaptcha_solver = RecaptchaSolver(self.browser)
+            else:
+                self.recaptcha_solver.driver = self.browser
             self.browser.get("https://www.einvoice.nat.gov.tw/accounts/login")
-            self.recaptcha_solver = RecaptchaSolver(self.browser)
             
             # Wait for page to load completely
-            WebDriverWait(self.browser, 15).until(
-                EC.presence_of_element_located((By.CSS_SELECTOR, 'a[href^="/accounts/login/b"]'))
-            )
+            self._wait_until(EC.presence_of_element_located(_BUSINESS_LOGIN_LINK), 15)
             
             # Select business login type
-            if not self._wait_and_click((By.CSS_SELECTOR, 'a[href^="/accounts/login/b"]'), use_js=True):
+            if not self._wait_and_click(_BUSINESS_LOGIN_LINK, use_js=True):
                 return False
             
             # Wait for login form to appear
-            WebDriverWait(self.browser, 10).until(
-                EC.presence_of_element_located((By.ID, "ban"))
-            )
+            self._wait_until(EC.presence_of_element_located(_LOGIN_FIELDS[0][0]), 10)
             
-            # Handle CAPTCHA - try automated solver first, fallback to manual input
-            captcha_code = None
-            if self.recaptcha_solver:
-                try:
-                    self.logger.info("Attempting to solve CAPTCHA automatically...")
-                    captcha_code = self.recaptcha_solver.solveAudioCaptcha()
-                    if captcha_code:
-                        self.logger.info("CAPTCHA solved automatically")
-                except Exception as e:
-                    self.logger.warning(f"Automatic CAPTCHA solving failed: {e}")
+            # Handle CAPTCHA - transcribe the audio in the background while filling the form
+            executor = ThreadPoolExecutor(max_workers=1)
+            try:
+                captcha_future = None
+                if self.recaptcha_solver:
+                    try:
+                        self.logger.info("Attempting to solve CAPTCHA automatically...")
+                        audio_source = self.recaptcha_solver.get_audio_source()
+                        captcha_future = executor.submit(self.recaptcha_solver.solve_audio_source, audio_source)
+                    except Exception as e:
+                        self.logger.warning(f"Automatic CAPTCHA solving failed: {e}")
+                
+                # Fill login form
+                for locator, attribute in _LOGIN_FIELDS:
+                    if not self._safe_send_keys(locator, getattr(loginInfo, attribute)):
+                        return False
+                
+                captcha_code = None
+                if captcha_future:
+                    try:
+                        captcha_code = captcha_future.result(timeout=120)
+                        if captcha_code:
+                            self.logger.info("CAPTCHA solved automatically")
+                    except Exception as e:
+                        self.logger.warning(f"Automatic CAPTCHA solving failed: {e}")
+            finally:
+                executor.shutdown(wait=False)
             
             # Fallback to manual input if automatic solving failed
             if not captcha_code:
@@ -220,23 +502,17 @@ class InvoiceDownloader:
 #                    self.logger.error("Captcha code is required")
                     return False
             
-            # Fill login form
-            login_fields = [
-                ((By.ID, "ban"), loginInfo.ban),
-                ((By.ID, "user_id"), loginInfo.user_id),
-                ((By.ID, "user_password"), loginInfo.password),
-                ((By.ID, "captcha"), captcha_code)
-            ]
-            
-            for locator, value in login_fields:
-                if not self._safe_send_keys(locator, value):
-                    return False
+            if not self._safe_send_keys(_CAPTCHA_INPUT, captcha_code):
+                return False
             
-            if not self._wait_and_click((By.ID, 'submitBtn'), use_js=True):
+            if not self._wait_and_click(_SUBMIT_BUTTON, use_js=True):
                 return False
             
-            # Wait for login to complete and page to load
-            time.sleep(5)
+            # Wait for login to complete and redirect to the dashboard
+            try:
+                self._wait_until(EC.url_contains('/dashboard'), 15)
+            except TimeoutException:
+                pass
 
             if not self.browser.current_url.startswith('https://www.einvoice.nat.gov.tw/dashboard'):
                 self.logger.error("Login verification failed")
@@ -254,31 +530,25 @@ class InvoiceDownloader:
     
     def _dismiss_popups(self):
         """Try to dismiss any popup dialogs that might appear."""
-        popup_selectors = [
-            'button[aria-label="Close"]',
-            '.modal-close',
-            '.close',
-            'button.btn-close',
-            '[data-dismiss="modal"]'
-        ]
-        
-        popup_texts = ['關閉', '確定', 'OK', 'Close']
-        
-        for selector in popup_selectors:
-            if self._wait_and_click((By.CSS_SELECTOR, selector), use_js=True):
-                self.logger.info(f"Closed popup with selector: {selector}")
-                return True
-        
-        for text in popup_texts:
-            if self._wait_and_click((By.XPATH, f"//button[contains(text(), '{text}')]"), use_js=True):
-                self.logger.info(f"Closed popup with text: {text}")
-                return True
+        # Sweep every candidate in the browser, one round trip per poll
+        try:
+            kind, value = self._wait_until(
+                lambda driver: driver.execute_script(self._DISMISS_POPUP_JS, _POPUP_SELECTORS, _POPUP_TEXTS), 3
+            )
+            self.logger.info(f"Closed popup with {kind}: {value}")
+            return True
+        except TimeoutException:
+            pass
         
         # Try pressing Escape key as last resort
         try:
             from selenium.webdriver.common.keys import Keys
-            self.browser.find_element(By.TAG_NAME, 'body').send_keys(Keys.ESCAPE)
-            time.sleep(0.5)
+            body = self._wait_until(EC.presence_of_element_located((By.TAG_NAME, 'body')), 2)
+            body.send_keys(Keys.ESCAPE)
+            try:
+                self._wait_until(EC.invisibility_of_element_located(_OPEN_MODAL), 2)
+            except TimeoutException:
+                pass
             self.logger.info("Tried to close popup with Escape key")
             return True
         except Exception:
@@ -290,13 +560,7 @@ class InvoiceDownloader:
     def navigate_to_download_page(self) -> bool:
         """Navigate to the invoice download page."""
         try:
-            navigation_steps = [
-                (By.ID, 'headingFunctionB2B_MENU'),
-                (By.ID, 'headingFunctionB2BC_SINGLE_QRY_DOWN'),
-                (By.ID, 'headingFunctionBTB412W')
-            ]
-            
-            for i, locator in enumerate(navigation_steps):
+            for i, locator in enumerate(_NAV_STEPS):
                 self.logger.info(f"Clicking navigation step {i+1}: {locator[1]}")
                 
                 if not self._wait_and_click(locator, use_js=True):
@@ -305,6 +569,10 @@ class InvoiceDownloader:
                 
                 self.logger.info(f"Successfully clicked {locator[1]}")
             
+            # Wait for the search form and remember its URL for later months
+            self._wait_until(EC.presence_of_element_located(_DATE_INPUT), 15)
+            self._download_page_url = self.browser.current_url
+            
             self.logger.info("Successfully navigated to download page")
             return True
             
@@ -315,66 +583,71 @@ class InvoiceDownloader:
     def configure_search_options(self, month_date: datetime.datetime, formatted_date: str) -> bool:
         """Configure search options and filters for a specific month."""
         try:
-            # Wait for page to be ready
-            time.sleep(1)
-            
             # Set the date input to specified month using the date picker
             try:
                 # Click the date input field to open the picker
-                if not self._wait_and_click((By.ID, "dp-input-date01"), use_js=True):
+                if not self._click_cached(_DATE_INPUT):
                     return False
                 
                 self.logger.info("Date picker opened")
-                time.sleep(0.5)
                 
                 # Wait for the overlay to appear
-                WebDriverWait(self.browser, 10).until(
-                    EC.presence_of_element_located((By.CSS_SELECTOR, ".dp__overlay.dp--overlay-relative"))
-                )
+                self._wait_until(EC.presence_of_element_located(_DATE_OVERLAY), 10)
                 
                 # Check if we need to change the year first
-                current_year_button = self.browser.find_element(By.CSS_SELECTOR, ".dp__btn.dp--year-select")
-                current_year_text = current_year_button.text.strip()
-                target_year = f"{month_date.year}年"
+                current_year_text = self._with_cached_element(
+                    _YEAR_SELECT, lambda button: button.text.strip(), 10
+                )
+                year_delta = month_date.year - int(current_year_text.replace('年', ''))
                 
-                if current_year_text != target_year:
-                    self.logger.info(f"Need to change year from {current_year_text} to {target_year}")
+                if year_delta:
+                    self.logger.info(f"Need to change year from {current_year_text} to {month_date.year}年")
                     
-                    if not self._wait_and_click((By.CSS_SELECTOR, ".dp__btn.dp--year-select"), use_js=True):
+                    if not self._click_cached(_YEAR_SELECT):
                         return False
                     
-                    time.sleep(0.5)
-                    
-                    # Navigate to the correct year using arrow buttons
-                    current_year_num = int(current_year_text.replace('年', ''))
-                    target_year_num = month_date.year
+                    # Navigate to the correct year, clicking the arrow once per year in a single script
+                    arrow_selector = (_NEXT_YEAR if year_delta > 0 else _PREV_YEAR)[1]
+                    try:
+                        self._wait_until(
+                            lambda driver: driver.execute_script(self._CLICK_REPEATEDLY_JS, arrow_selector, abs(year_delta)),
+                            10
+                        )
+                    except TimeoutException:
+                        self.logger.error(f"Year navigation button not found: {arrow_selector}")
+                        return False
                     
-                    if target_year_num < current_year_num:
-                        # Click previous year button
-                        for _ in range(current_year_num - target_year_num):
-                            if not self._wait_and_click((By.CSS_SELECTOR, ".dp__btn.dp--arrow-btn-nav[aria-label='Previous year']"), use_js=True):
-                                return False
-                            time.sleep(0.3)
-                    elif target_year_num > current_year_num:
-                        # Click next year button
-                        for _ in range(target_year_num - current_year_num):
-                            if not self._wait_and_click((By.CSS_SELECTOR, ".dp__btn.dp--arrow-btn-nav[aria-label='Next year']"), use_js=True):
-                                return False
-                            time.sleep(0.3)
+                    # Confirm the picker reached the target year before choosing the month,
+                    # polling more gently since each check reads the DOM text
+                    target_year = f"{month_date.year}年"
+                    try:
+                        self._wait_until(
+                            lambda driver: driver.find_element(*_YEAR_SELECT).text.strip() == target_year, 5, 0.5
+                        )
+                    except TimeoutException:
+                        # Picking the month now would export the wrong year's invoices
+                        self.logger.error(f"Date picker year not confirmed as {target_year}")
+                        return False
                 
                 # Now select the correct month
                 target_month_text = f"{month_date.month}月"
                 
-                if not self._wait_and_click((By.CSS_SELECTOR, f'div[data-test="{target_month_text}"]'), use_js=True):
+                if not self._wait_and_click(_MONTH_CELLS[month_date.month - 1], use_js=True):
                     return False
                 
                 self.logger.info(f"Selected month: {target_month_text}")
-                time.sleep(0.5)
+                
+                # The picker closes once the month is applied
+                try:
+                    self._wait_until(EC.invisibility_of_element_located(_DATE_OVERLAY), 2)
+                except TimeoutException:
+                    self.logger.warning("Date picker still open after selecting month")
                 
                 # Verify the selection was successful by checking the input value
                 try:
-                    date_input = self.browser.find_element(By.ID, "dp-input-date01")
-                    updated_value = date_input.get_attribute("value")
+                    updated_value = self._with_cached_element(
+                        _DATE_INPUT, lambda date_input: date_input.get_attribute("value"), 2
+                    )
                     self.logger.info(f"Date input updated to: {updated_value}")
                 except Exception as e:
                     self.logger.warning(f"Could not verify date input value: {e}")
@@ -388,18 +661,22 @@ class InvoiceDownloader:
                     pass
                 return False
             
-            radio_options = [
-                (By.ID, "queryInvType_1"),
-                (By.ID, "businessType_1")
-            ]
+            # Check all radio buttons in one script and verify their state
+            try:
+                self._wait_until(
+                    lambda driver: all(driver.execute_script(self._CHECK_RADIOS_JS, _RADIO_OPTIONS)), 10
+                )
+            except TimeoutException:
+                checked = self.browser.execute_script(self._CHECK_RADIOS_JS, _RADIO_OPTIONS)
+                for radio_id, is_checked in zip(_RADIO_OPTIONS, checked):
+                    if not is_checked:
+                        self.logger.error(f"Failed to select radio button {radio_id}")
+                return False
             
-            for locator in radio_options:
-                if not self._wait_and_click(locator, use_js=True):
-                    self.logger.error(f"Failed to select radio button {locator[1]}")
-                    return False
-                self.logger.info(f"Selected radio button: {locator[1]}")
+            for radio_id in _RADIO_OPTIONS:
+                self.logger.info(f"Selected radio button: {radio_id}")
             
-            if not self._wait_and_click((By.CSS_SELECTOR, 'button[title="查詢"]'), use_js=True):
+            if not self._wait_and_click(_SEARCH_BUTTON, use_js=True):
                 self.logger.error("Failed to click search button")
                 return False
             
@@ -407,10 +684,8 @@ class InvoiceDownloader:
             
             # Wait for search results to load
             try:
-                WebDriverWait(self.browser, 2.5).until(
-                    EC.presence_of_element_located(
-                        (By.XPATH, "//span[text()='查詢成功。']")
-                    )
+                self._wait_until(
+                    lambda driver: driver.execute_script(self._SPAN_TEXT_PRESENT_JS, _SEARCH_SUCCESS_TEXT), 2.5
                 )
 
             except TimeoutException:
@@ -421,15 +696,22 @@ class InvoiceDownloader:
             
             # Set page size to maximum
             try:
-                select_element = WebDriverWait(self.browser, 15).until(
-                    EC.presence_of_element_located((By.CSS_SELECTOR, 'select[title="分頁"]'))
-                )
-                self.browser.execute_script("arguments[0].scrollIntoView({block: 'center'});", select_element)
-                time.sleep(0.5)
-                select = Select(select_element)
-                select.select_by_value("1000")
+                select_element = self._wait_until(EC.presence_of_element_located(_PAGE_SIZE_SELECT), 15)
+                snapshot = self._result_table_snapshot()
+                
+                previous_size = self.browser.execute_script(self._SET_SELECT_VALUE_JS, select_element, "1000")
+                if previous_size is None:
+                    self.logger.warning("Page size option 1000 not available - continuing without changing page size")
+                    return True
                 self.logger.info("Page size set to 1000")
-                time.sleep(1)  # Wait for page to reload with new size
+                
+                # Only a full page can grow when the page size increases
+                if snapshot and previous_size.isdigit() and snapshot[2] < int(previous_size):
+                    snapshot = None
+                
+                # Wait for page to reload with new size
+                if not self._wait_for_table_change(snapshot):
+                    self.logger.warning("Result table did not refresh after changing page size")
             except TimeoutException:
                 self.logger.warning("Could not find page size selector - continuing without changing page size")
             except Exception as e:
@@ -448,59 +730,50 @@ class InvoiceDownloader:
             
             while True:
                 page_count += 1
-                self.logger.info(f"Processing page {page_count}")
+                self.logger.debug(f"Processing page {page_count}")
                 
-                # Scroll to top first to ensure we can see the elements
-                self.browser.execute_script("window.scrollTo(0, 0);")
-                time.sleep(0.5)
+                existing_files = self._download_dir_names()
                 
+                # Select all, download and check the next page button in one round trip per poll
                 try:
-                    # Check if checkbox is already selected first
-                    checkbox = WebDriverWait(self.browser, 15).until(
-                        EC.presence_of_element_located((By.ID, "checkbox-all"))
+                    page_state = self._wait_until(
+                        lambda driver: driver.execute_async_script(
+                            self._SELECT_ALL_AND_DOWNLOAD_JS,
+                            _CHECKBOX_ALL[1], _DOWNLOAD_BUTTON[1], _NEXT_PAGE_BUTTON[1]
+                        ),
+                        15
                     )
-                    
-                    if not checkbox.is_selected():
-                        if not self._wait_and_click((By.ID, "checkbox-all"), use_js=True):
-                            self.logger.error(f"Failed to click select all checkbox on page {page_count}")
-                            return False
-                        self.logger.info(f"Select all checkbox clicked on page {page_count}")
-                    else:
-                        self.logger.info(f"Select all checkbox already selected on page {page_count}")
-                    
-                    time.sleep(0.5)
-                    
-                except Exception as e:
-                    self.logger.error(f"Failed to handle checkbox on page {page_count}: {e}")
+                except TimeoutException:
+                    self.logger.error(f"Failed to select and download invoices on page {page_count}")
                     return False
                 
-                if not self._wait_and_click((By.CSS_SELECTOR, 'button[title="下載Excel檔"]'), use_js=True):
-                    self.logger.error(f"Failed to click download button on page {page_count}")
-                    return False
+                if not page_state["selected"]:
+                    self.logger.warning(f"Select all checkbox not reported as selected on page {page_count}")
                 
-                self.logger.info(f"Download button clicked successfully on page {page_count}")
+                self.logger.debug(f"Download button clicked successfully on page {page_count}")
                 self.total_downloads += 1
 
-                # Wait for Download to complete
-                time.sleep(5)
+                # Only wait for the download to start; wait_for_download collects every page at the end
+                if not self._wait_for_download_start(existing_files):
+                    self.logger.warning(f"Download from page {page_count} did not start within 10 s")
                 
                 # Check if there's a next page
                 try:
-                    next_button = WebDriverWait(self.browser, 15).until(
-                        EC.presence_of_element_located((By.CSS_SELECTOR, 'button[title="下一頁"]'))
-                    )
-                    
-                    # Check if next button is disabled (no more pages)
-                    if next_button.get_attribute('disabled'):
+                    # Check if next button is missing or disabled (no more pages)
+                    if not page_state["hasNext"]:
                         self.logger.info(f"No more pages. Completed processing {page_count} page(s)")
                         break
                     else:
-                        if not self._wait_and_click((By.CSS_SELECTOR, 'button[title="下一頁"]'), use_js=True):
+                        snapshot = self._result_table_snapshot()
+                        if not self._click_cached(_NEXT_PAGE_BUTTON):
                             self.logger.error(f"Failed to click next page button on page {page_count}")
                             break
                         
-                        self.logger.info(f"Moving to page {page_count + 1}")
-                        time.sleep(2)  # Wait for page to load
+                        self.logger.debug(f"Moving to page {page_count + 1}")
+                        
+                        # Wait for the next page of results to load
+                        if not self._wait_for_table_change(snapshot):
+                            self.logger.warning(f"Result table did not change after moving to page {page_count + 1}")
                         
                 except Exception as e:
                     self.logger.error(f"Failed to check next page button on page {page_count}: {e}")
@@ -513,25 +786,156 @@ class InvoiceDownloader:
             self.logger.error(f"Download failed: {e}")
             return False
     
+    def _download_dir_names(self) -> set:
+        """Return our downloads in the directory, finished or in progress, without the .crdownload suffix."""
+        names = set()
+        with os.scandir(self.download_dir) as entries:
+            for entry in entries:
+                # A finished rename of an earlier page's partial file keeps the same name
+                name = entry.name[:-len(".crdownload")] if entry.name.endswith(".crdownload") else entry.name
+                # Chrome's "Unconfirmed N" placeholders are skipped: they may belong to the user,
+                # and their rename to our name would look like a second new download
+                if name.startswith(self.prefix):
+                    names.add(name)
+        return names
+    
+    def _wait_for_download_start(self, existing_files: set, timeout: float = 10) -> bool:
+        """Poll until Chrome creates a new download of ours, finished or still in progress."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self._download_dir_names() - existing_files:
+                return True
+            time.sleep(0.05)
+        return False
+    
+    def _list_output_files(self, limit: int = None) -> List[os.DirEntry]:
+        """List finished downloads matching the prefix, stopping after limit matches."""
+        matched_files = []
+        with os.scandir(self.download_dir) as entries:
+            for entry in entries:
+                if entry.name.startswith(self.prefix) and entry.name.endswith(".xls"):
+                    matched_files.append(entry)
+                    if limit and len(matched_files) >= limit:
+                        break
+        return matched_files
+    
+    def _wait_with_observer(self, max_wait_time: int) -> List[os.DirEntry]:
+        """Block on filesystem events until all downloads have landed."""
+        finished = threading.Event()
+        observer = Observer()
+        observer.schedule(_DownloadEventHandler(self, finished), str(self.download_dir))
+        observer.start()
+        try:
+            # Re-check in case the last file landed before the observer started
+            if len(self._list_output_files(self.total_downloads)) != self.total_downloads:
+                finished.wait(max_wait_time)
+        finally:
+            observer.stop()
+            observer.join()
+        return self._list_output_files(self.total_downloads)
+    
+    def _wait_with_polling(self, max_wait_time: int) -> List[os.DirEntry]:
+        """Poll the download directory until all downloads have landed."""
+        start_time = time.time()
+        matched_files = self._list_output_files(self.total_downloads)
+        while len(matched_files) != self.total_downloads and time.time() - start_time < max_wait_time:
+            time.sleep(0.5)
+            matched_files = self._list_output_files(self.total_downloads)
+        return matched_files
+    
     def wait_for_download(self, max_wait_time: int = 60) -> str:
         """Wait for download to complete and return file path."""
+        matched_files = self._list_output_files(self.total_downloads)
+        if len(matched_files) != self.total_downloads:
+            if Observer is not None:
+                matched_files = self._wait_with_observer(max_wait_time)
+            else:
+                matched_files = self._wait_with_polling(max_wait_time)
         
-        start_time = time.time()
-        while time.time() - start_time < max_wait_time:
-            matched_files = glob.glob(self.pattern)
-            if len(matched_files) == self.total_downloads:
-                for file in matched_files:
-                    self.logger.info(f"Found the matching file: {os.path.basename(file)}")
-                return matched_files
-            time.sleep(0.5)
+        if len(matched_files) == self.total_downloads:
+            for entry in matched_files:
+                self.logger.info(f"Found the matching file: {entry.name}")
+            return [entry.path for entry in matched_files]
         
         self.logger.error("Download timeout - files not found")
         return None
     
+    def _collect_month_files(self, files: List[str], month_date: datetime.datetime) -> List[str]:
+        """Move a month's downloads from its staging folder into the download directory."""
+        collected = []
+        for file in files:
+            name = os.path.basename(file)
+            target = self.download_dir / name
+            if target.exists():
+                # Both months may have produced a file with the same name
+                target = self.download_dir / f"{Path(name).stem}_{month_date:%Y%m}.xls"
+            os.replace(file, target)
+            collected.append(str(target))
+        
+        try:
+            os.rmdir(self.download_dir / f"{month_date:%Y%m}")
+        except OSError:
+            pass
+        
+        return collected
+    
+    def _run_single_month(self, target_month: Tuple[datetime.datetime, str]) -> List[str]:
+        """Download one month in its own browser session and staging folder."""
+        month_date, formatted_date = target_month
+        worker = InvoiceDownloader(webdriver_path=self.webdriver_path,
+                                   command_executor=self.command_executor,
+                                   download_dir=str(self.download_dir / f"{month_date:%Y%m}"),
+                                   prefix=self.prefix,
+                                   timeout=self.timeout)
+        worker.download_dir.mkdir(exist_ok=True)
+        worker.cleanup_old_files()
+        
+        with worker.get_browser():
+            if not worker.login():
+                raise Exception(f"Login failed for {formatted_date}")
+            
+            if not worker.navigate_to_download_page():
+                raise Exception(f"Navigation failed for {formatted_date}")
+            
+            if not worker.configure_search_options(month_date, formatted_date):
+                self.logger.error(f"Search configuration failed for {formatted_date}")
+                return []
+            
+            if not worker.download_invoices():
+                self.logger.error(f"Download initiation failed for {formatted_date}")
+                return []
+            
+            downloaded_files = worker.wait_for_download()
+            if downloaded_files is None:
+                raise Exception(f"Download did not complete for {formatted_date}.")
+        
+        return self._collect_month_files(downloaded_files, month_date)
+    
+    def _run_parallel(self, target_months: List[Tuple[datetime.datetime, str]]) -> List[str]:
+        """Download all target months concurrently, one browser per month."""
+        if not self.cleanup_old_files():
+            raise Exception("Cleanup failed")
+        
+        with ThreadPoolExecutor(max_workers=len(target_months)) as executor:
+            results = list(executor.map(self._run_single_month, target_months))
+        
+        downloaded_files = [file for files in results for file in files]
+        if not downloaded_files:
+            raise Exception("Download did not complete.")
+        
+        for file in downloaded_files:
+            self.logger.info(f"Found the matching file: {os.path.basename(file)}")
+        return downloaded_files
+    
     def run(self) -> str:
         """Execute the complete download process."""
         self.logger.info("Starting invoice download process")
         
+        if self.parallel_months:
+            target_months = self._get_target_months()
+            if len(target_months) > 1:
+                return self._run_parallel(target_months)
+        
         with self.get_browser():
             if not self.login():
                 raise Exception("Login failed")
@@ -548,11 +952,16 @@ class InvoiceDownloader:
             for i, (month_date, formatted_date) in enumerate(target_months):
                 self.logger.info(f"Processing month {i+1}: {formatted_date}")
                 
-                # For subsequent months, we need to refresh the page or reset the form
+                # For subsequent months, load a fresh search form from the remembered URL
                 if i > 0:
-                    self.logger.info("Refreshing page for next month...")
-                    self.browser.refresh()
-                    time.sleep(2)
+                    self.logger.info("Reloading download page for next month...")
+                    self.browser.get(self._download_page_url)
+                    self._element_cache.clear()
+                    try:
+                        self._wait_until(EC.presence_of_element_located(_DATE_INPUT), 15)
+                    except TimeoutException:
+                        self.logger.error(f"Download page did not reload for {formatted_date}")
+                        continue
             
                 # Configure search for this specific month
                 if not self.configure_search_options(month_date, formatted_date):
@@ -1,46 +1,153 @@
 import os
-import asyncio
-import aiohttp
-import datetime
-import subprocess
+import re
+import atexit
+import logging
+import shutil
 import tempfile
+import threading
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-import whisper
+from faster_whisper import WhisperModel, decode_audio
+import ctranslate2
+
+logger = logging.getLogger(__name__)
+
+# Model load futures shared by every solver, keyed by (model_size, device, compute_type)
+_MODEL_CACHE = {}
+_MODEL_CACHE_LOCK = threading.Lock()
+_MODEL_LOADER = ThreadPoolExecutor(max_workers=1)
+
+# Chinese numerals (and 'E', a common mishearing of 一) to digits; ASCII digits pass through
+_DIGIT_TABLE = str.maketrans({
+    '一': '1', '二': '2', '三': '3', '四': '4', '五': '5',
+    '六': '6', '七': '7', '八': '8', '九': '9', '零': '0',
+    'E': '1'
+})
+# Everything the table cannot turn into a digit
+_NOT_DIGIT_OR_NUMERAL = re.compile(r'[^0-9一二三四五六七八九零E]')
+
+# Greedy first, then slightly sampled decodes so a retry can hear the clip differently
+_RETRY_TEMPERATURES = (0.0, 0.2, 0.4)
+
+
+def _pick_device(device, compute_type):
+    """Resolve the device and compute type; CUDA is only picked automatically when nothing was chosen"""
+    if device:
+        return device, compute_type or ("float16" if device == "cuda" else "int8")
+    if compute_type:
+        # An explicit compute type keeps the CPU model callers got before CUDA detection
+        return "cpu", compute_type
+    try:
+        if ctranslate2.get_cuda_device_count() > 0 and "float16" in ctranslate2.get_supported_compute_types("cuda"):
+            return "cuda", "float16"
+    except Exception as e:
+        logger.warning("CUDA check failed, using the CPU: %s", e)
+    return "cpu", "int8"
+
+
+def _create_model(model_size, device, compute_type):
+    # A five-second clip cannot keep many cores busy; more threads only add wake-up overhead
+    model = WhisperModel(model_size, device=device, compute_type=compute_type,
+                         cpu_threads=min(4, os.cpu_count() or 1))
+    # One second of silence makes the first real CAPTCHA skip the one-time allocations,
+    # and surfaces missing CUDA libraries here rather than at login
+    segments, _ = model.transcribe(np.zeros(16000, dtype=np.float32), language="zh",
+                                   beam_size=1, without_timestamps=True)
+    list(segments)
+    return model
+
+
+def _load_model(model_size, device, compute_type):
+    """Load a Whisper model and warm it up, falling back to CPU int8 if the GPU path fails"""
+    logger.info("Loading Whisper model: %s (%s, %s)", model_size, device, compute_type)
+    try:
+        model = _create_model(model_size, device, compute_type)
+    except Exception as e:
+        if device == "cpu":
+            raise
+        # The driver can report a GPU while cuBLAS/cuDNN are missing
+        logger.warning("Whisper model failed on %s (%s), falling back to cpu int8", device, e)
+        model = _create_model(model_size, "cpu", "int8")
+    logger.info("Whisper model loaded successfully")
+    return model
+
+
+def _get_model_future(model_size, device, compute_type):
+    """Start loading a model in the background once per process; parallel workers share it"""
+    key = (model_size, device, compute_type)
+    with _MODEL_CACHE_LOCK:
+        future = _MODEL_CACHE.get(key)
+        if future is not None:
+            return future
+        future = _MODEL_CACHE[key] = _MODEL_LOADER.submit(_load_model, model_size, device, compute_type)
+
+    def evict_on_failure(done):
+        # Only successful loads stay cached, so the next solver retries a failed one
+        if done.exception() is not None:
+            with _MODEL_CACHE_LOCK:
+                if _MODEL_CACHE.get(key) is done:
+                    del _MODEL_CACHE[key]
+
+    # Registered outside the lock: the callback runs inline if the load already finished
+    future.add_done_callback(evict_on_failure)
+    return future
+
 
 class RecaptchaSolver:
-    def __init__(self, driver, model_size="base"):
+    def __init__(self, driver, model_size=None, compute_type=None, device=None):
         self.driver = driver
-        # Initialize Whisper model
+        # Initialize Whisper model on the CTranslate2 backend
         # Available models: tiny, base, small, medium, large
-        # "base" is a good balance between speed and accuracy
-        print(f"Loading Whisper model: {model_size}")
-        self.model = whisper.load_model(model_size)
-        print("Whisper model loaded successfully")
-
-    async def download_audio(self, url, path):
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as response:
-                with open(path, 'wb') as f:
-                    f.write(await response.read())
-        print("Downloaded audio asynchronously.")
-
-    def recognize_audio_with_whisper(self, audio_path):
-        """Recognize audio using OpenAI Whisper"""
+        # "tiny" is enough for five spoken digits; set WHISPER_MODEL_SIZE to override
+        model_size = model_size or os.environ.get("WHISPER_MODEL_SIZE", "tiny")
+        # With neither set: the GPU in float16 when CUDA supports it, otherwise int8 on the CPU
+        # device: "cpu" or "cuda"; compute_type: "int8", "int8_float32", "float16", "float32", ...
+        # Passing only compute_type keeps the model on the CPU
+        device, compute_type = _pick_device(device, compute_type)
+        # Load while the browser works; the first transcription waits for it if needed
+        self._model_future = _get_model_future(model_size, device, compute_type)
+        # One scratch folder per solver; each solve overwrites the same file
+        self._temp_dir = tempfile.mkdtemp(prefix="captcha_")
+        atexit.register(shutil.rmtree, self._temp_dir, ignore_errors=True)
+
+    @property
+    def model(self):
+        return self._model_future.result()
+
+    def download_audio(self, url, path):
+        # A single blocking GET; copyfileobj streams it to disk in chunks
+        with urllib.request.urlopen(url, timeout=10) as response, open(path, 'wb') as f:
+            shutil.copyfileobj(response, f)
+        print("Downloaded audio.")
+
+    def recognize_audio_with_whisper(self, audio, temperature=0.0):
+        """Recognize audio using Whisper; accepts a file path or 16 kHz mono float32 samples"""
         try:
-            # Whisper can handle various audio formats directly
-            print(f"Transcribing audio: {audio_path}")
+            print(f"Transcribing audio (temperature {temperature})")
             
             # Transcribe with language hint for better accuracy
             # Set language to Chinese for better recognition of Chinese numbers
-            result = self.model.transcribe(
-                audio_path,
+            segments, _ = self.model.transcribe(
+                audio,
                 language="zh",  # Chinese language hint
-                task="transcribe"
+                task="transcribe",
+                # Single-pass decode; the answer is a short digit string
+                temperature=temperature,
+                beam_size=1,
+                best_of=1,
+                without_timestamps=True,
+                condition_on_previous_text=False,
+                initial_prompt="這是五位數字驗證碼",
+                # Built-in Silero VAD keeps only the spoken part of the clip
+                vad_filter=True
             )
             
-            recognized_text = result["text"].strip()
+            # Segments are generated lazily; joining them runs the decode
+            recognized_text = "".join(segment.text for segment in segments).strip()
             print(f"Whisper recognition result: {recognized_text}")
             
             return recognized_text
@@ -49,81 +156,62 @@ class RecaptchaSolver:
             print(f"Whisper recognition failed: {e}")
             return None
 
-    def convert_audio_format(self, input_path, output_path):
-        """Convert audio to a format that works well with Whisper"""
-        command = [
-            "ffmpeg",
-            "-y",  # overwrite if file exists
-            "-i", input_path,
-            "-ar", "16000",  # 16kHz sample rate (Whisper's preferred)
-            "-ac", "1",      # Mono
-            "-c:a", "pcm_s16le",  # 16-bit PCM
-            output_path
-        ]
-        try:
-            subprocess.run(command, capture_output=True, text=True, check=True)
-            print("Audio conversion successful")
-            return True
-        except subprocess.CalledProcessError as e:
-            print("FFmpeg conversion failed.")
-            print("STDOUT:", e.stdout)
-            print("STDERR:", e.stderr)
-            return False
-
     def solveAudioCaptcha(self):
+        audio_source = self.get_audio_source()
+        return self.solve_audio_source(audio_source)
+
+    def get_audio_source(self):
+        """Play the audio CAPTCHA and return its source URL"""
         try:
             self.driver.switch_to.default_content()
 
             # Click on the audio button
-            audio_button = WebDriverWait(self.driver, 10).until(
+            audio_button = WebDriverWait(self.driver, 10, poll_frequency=0.1).until(
                 EC.element_to_be_clickable((By.CSS_SELECTOR, 'button[title="語音播放圖形驗證碼"]'))
             )
             audio_button.click()
 
             # Get the audio source URL
-            audio_source = WebDriverWait(self.driver, 10).until(
+            audio_source = WebDriverWait(self.driver, 10, poll_frequency=0.1).until(
                 EC.presence_of_element_located((By.TAG_NAME, 'audio'))
             ).get_attribute('src')
             print("Audio source URL detected")
+            return audio_source
+
+        except Exception as e:
+            print(f"An error occurred while fetching audio CAPTCHA: {e}")
+            raise
+
+        finally:
+            # Always switch back to the main content
+            self.driver.switch_to.default_content()
+
+    def solve_audio_source(self, audio_source):
+        """Download and transcribe the CAPTCHA audio; makes no browser calls"""
+        try:
+            path_to_original = os.path.join(self._temp_dir, "audio.mp3")
             
-            # Create temporary files
-            with tempfile.TemporaryDirectory() as temp_dir:
-                timestamp = datetime.datetime.now().strftime('%Y%m%d%H%M%S')
-                path_to_original = os.path.join(temp_dir, f"{timestamp}.mp3")
-                path_to_converted = os.path.join(temp_dir, f"{timestamp}_converted.wav")
-                
-                # Download the audio asynchronously
-                asyncio.run(self.download_audio(audio_source, path_to_original))
-
-                # Convert audio format for better compatibility
-                if not self.convert_audio_format(path_to_original, path_to_converted):
-                    print("Audio conversion failed, trying with original file")
-                    audio_file_to_use = path_to_original
-                else:
-                    audio_file_to_use = path_to_converted
-
-                # Recognize the audio using Whisper
-                captcha_text = None
-                for attempt in range(3):
-                    try:
-                        recognized_text = self.recognize_audio_with_whisper(audio_file_to_use)
-                        if recognized_text:
-                            # Clean up the text (remove spaces, punctuation)
-                            captcha_text = ''.join(char for char in recognized_text if char.isalnum() or char in '一二三四五六七八九零')
-                            print(f"Cleaned recognized text: {captcha_text}")
+            # Download the audio
+            self.download_audio(audio_source, path_to_original)
+
+            # Decode once to 16 kHz mono float32 so retries skip the MP3 decode
+            audio = decode_audio(path_to_original, sampling_rate=16000)
+
+            # Recognize the audio using Whisper, stopping at the first valid code
+            captcha_number = None
+            for attempt, temperature in enumerate(_RETRY_TEMPERATURES, 1):
+                try:
+                    recognized_text = self.recognize_audio_with_whisper(audio, temperature)
+                    if recognized_text:
+                        # Convert Chinese numbers to digits
+                        captcha_number = self.convert_chinese_to_digits(recognized_text)
+                        if captcha_number:
                             break
-                    except Exception as e:
-                        print(f"Whisper recognition attempt {attempt + 1} failed: {e}")
+                except Exception as e:
+                    print(f"Whisper recognition attempt {attempt} failed: {e}")
 
-            if not captcha_text:
-                print("Failed to solve audio CAPTCHA with Whisper")
-                return None
-            
-            # Convert Chinese numbers to digits
-            captcha_number = self.convert_chinese_to_digits(captcha_text)
-            
             if not captcha_number:
-                print("Failed to convert recognized text to numbers")
+                print("Failed to solve audio CAPTCHA with Whisper")
                 return None
 
             print(f"Final CAPTCHA number: {captcha_number}")
@@ -131,38 +219,17 @@ class RecaptchaSolver:
 
         except Exception as e:
             print(f"An error occurred while solving audio CAPTCHA: {e}")
-            self.driver.switch_to.default_content()
             raise
 
-        finally:
-            # Always switch back to the main content
-            self.driver.switch_to.default_content()
-
     def convert_chinese_to_digits(self, text):
         """Convert Chinese numbers to digits"""
-        captcha_number = ''
-        
-        # Handle both traditional and simplified Chinese numbers
-        chinese_to_digit = {
-            '一': '1', '二': '2', '三': '3', '四': '4', '五': '5',
-            '六': '6', '七': '7', '八': '8', '九': '9', '零': '0',
-            # Also handle potential variations
-            '1': '1', '2': '2', '3': '3', '4': '4', '5': '5',
-            '6': '6', '7': '7', '8': '8', '9': '9', '0': '0',
-            # Other circumstances
-            'E': '1'
-        }
-        
-        for char in text:
-            if char in chinese_to_digit:
-                captcha_number += chinese_to_digit[char]
-            else:
-                # If we encounter an unrecognized character, log it but continue
-                print(f"Unrecognized character: {char}")
+        # Drop spaces, punctuation and unknown characters, then map numerals to digits
+        captcha_number = _NOT_DIGIT_OR_NUMERAL.sub('', text).translate(_DIGIT_TABLE)
+        logger.debug("Cleaned recognized text: %s", captcha_number)
         
         # Validate the result (typical CAPTCHA length)
         if len(captcha_number) == 5:
             return captcha_number
         else:
-            print(f"Invalid CAPTCHA length: {len(captcha_number)}")
+            logger.debug("Invalid CAPTCHA length: %d (%r)", len(captcha_number), text)
             return None
\ No newline at end of file